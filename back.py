@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 import platform
@@ -7,15 +9,17 @@ import tempfile
 import time
 import warnings
 import zipfile
+from functools import partial
 from itertools import chain
 from pathlib import Path
 from sqlite3 import Connection, Cursor
-from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import yaml
 from tqdm import tqdm
 
 GAMESTATE = "gamestate"
+STELLARIS_APP_ID = "281990"
 BASE_PATH = Path(getattr(sys, "_MEIPASS", os.path.abspath(".")))
 
 ## CONSTANT REQUEST
@@ -31,9 +35,8 @@ def combine_multiple_savegames_folder(
         yield from filter(os.path.isdir, candidate_path.glob("*"))
 
 
-def get_saves_folder() -> Iterable[Path]:
-    """Return the stellaris save location"""
-    # determine the platform
+def get_steam_folder() -> Optional[Path]:
+    """Return the steam install location, None if it can not be found."""
     system = platform.system()
     if system == "Windows":
         import winreg
@@ -49,14 +52,30 @@ def get_saves_folder() -> Iterable[Path]:
                 return None
             return None
 
+        steam_path = read_reg(ep=winreg.HKEY_LOCAL_MACHINE, p=r"SOFTWARE\Wow6432Node\Valve\Steam", k='InstallPath')
+        return Path(steam_path) if steam_path is not None else None
+    if system == "Darwin":
+        return Path(os.environ.get("HOME")).joinpath("Library/Application Support/Steam")
+    if system == "Linux":
+        steam_path = os.environ.get("STEAMFOLDER")
+        return Path(steam_path) if steam_path is not None else Path(os.environ.get("HOME")).joinpath(
+            ".local/share/Steam")
+    return None
+
+
+def get_saves_folder() -> Iterable[Path]:
+    """Return the stellaris save location"""
+    # determine the platform
+    system = platform.system()
+    steam_path = get_steam_folder()
+    if system == "Windows":
         # WINDOWS
         base = Path(os.environ.get("USERPROFILE"))  # search base
         target_1 = base.joinpath("Documents/Paradox Interactive/Stellaris/save games")
         target_2 = base.joinpath("Documents/Paradox Interactive/Stellaris Plaza/save games")
 
-        steam_path = str(read_reg(ep=winreg.HKEY_LOCAL_MACHINE, p=r"SOFTWARE\Wow6432Node\Valve\Steam", k='InstallPath'))
-        targets_3 = [steam_user_path.joinpath("281990/remote/save games") for steam_user_path in
-                     Path(steam_path).joinpath("userdata").glob("*")]
+        targets_3 = [steam_user_path.joinpath(f"{STELLARIS_APP_ID}/remote/save games") for steam_user_path in
+                     steam_path.joinpath("userdata").glob("*")] if steam_path is not None else []
         return combine_multiple_savegames_folder([target_1, target_2, *targets_3])
     if system == "Darwin":
         # MAC
@@ -64,91 +83,203 @@ def get_saves_folder() -> Iterable[Path]:
         return combine_multiple_savegames_folder([target])
     if system == "Linux":
         target_1 = Path(os.environ.get("HOME")).joinpath(".local/share/Paradox Interactive/Stellaris/save games")
-        target_2 = Path(os.environ.get("$STEAMFOLDER")).joinpath(
-            f"userdata/{os.environ.get('STEAMID')}/281990/remote/save games")
+        target_2 = steam_path.joinpath(
+            f"userdata/{os.environ.get('STEAMID')}/{STELLARIS_APP_ID}/remote/save games")
         target_3 = Path(os.environ.get("HOME")).joinpath(".local/share/Paradox Interactive/Stellaris Plaza/save games")
         return combine_multiple_savegames_folder([target_1, target_2, target_3])
     warnings.warn("Unrecognized system")
 
 
-def recursivly_parse_flags(flag_amp: Dict, cursor: Cursor, upper_tag: Optional[str] = None):
+def flatten_flag_map(flag_amp: Dict, flat_map: Optional[Dict] = None, upper_tag: Optional[str] = None) -> Dict:
     """
-    TODO:
-    :param flag_amp:
-    :param cursor:
-    :return:
+    Flatten the flags.yaml tree into the rows of the tags and one_of tables.
+    :param flag_amp: the (sub) tree from the flags.yaml
+    :param flat_map: the flattened map being filled
+    :param upper_tag: the parent tag of the sub tree
+    :return: a dictionary with keys 'tags' (tag_id: {parent_tag, display, target}) and 'one_of' (list of tag_id)
     """
-    # TODO: add one_of and any_of flag
+    if flat_map is None:
+        flat_map = {"tags": {}, "one_of": []}
     for key, value in flag_amp.items():
         if (key == "one_of") or (key == "any_of"):
             if key == "one_of":
-                cursor.execute("""INSERT INTO one_of (tag_id) VALUES (?)""", (upper_tag,))
+                flat_map["one_of"].append(upper_tag)
             # value is a list
             for subkey in value:
-                recursivly_parse_flags(subkey, cursor, upper_tag)
+                flatten_flag_map(subkey, flat_map, upper_tag)
         elif isinstance(value, dict):
             if "target" not in value.keys():
                 # continue parsing
-                cursor.execute("""INSERT INTO tags (tag_id, parent_tag_id, display) VALUES(?,?,?)""",
-                               (key, upper_tag, None))
-                recursivly_parse_flags(value, cursor, key)
+                flat_map["tags"][key] = {"parent_tag": upper_tag, "display": None, "target": None}
+                flatten_flag_map(value, flat_map, key)
             else:
                 # final parse
-                cursor.execute("""INSERT INTO tags (tag_id, parent_tag_id, display, target) VALUES(?,?,?,?)""",
-                               (key, upper_tag, value["display"], value["target"]))
+                flat_map["tags"][key] = {"parent_tag": upper_tag, "display": value["display"],
+                                         "target": value["target"]}
+    return flat_map
+
+
+def get_one_of_childs(flat_map: Dict) -> Dict[str, Dict[str, Optional[str]]]:
+    """Get the child tags (tag_id: target) of each one_of group, in the flags.yaml order."""
+    one_of_childs = {tag_id: {} for tag_id in flat_map["one_of"]}
+    for tag_id, tag in flat_map["tags"].items():
+        if tag["parent_tag"] in one_of_childs:
+            one_of_childs[tag["parent_tag"]][tag_id] = tag["target"]
+    return one_of_childs
+
+
+def diff_flag_map(old_map: Dict, new_map: Dict) -> Dict[str, Set[str]]:
+    """
+    Compute what changed between two flattened flag maps.
+    :param old_map: the flattened map the save was scanned against
+    :param new_map: the flattened map from the current flags.yaml
+    :return: a dictionary of tag_id sets with keys 'new', 'removed', 'changed' and 'retargeted' for the tags
+    (retargeted tags are the changed tags with a different target) and 'new_one_of', 'removed_one_of' and
+    'changed_one_of' for the one_of groups.
+    """
+    old_tags, new_tags = old_map["tags"], new_map["tags"]
+    changed = {tag_id for tag_id in old_tags.keys() & new_tags.keys() if old_tags[tag_id] != new_tags[tag_id]}
+    old_one_of, new_one_of = get_one_of_childs(old_map), get_one_of_childs(new_map)
+    return {
+        "new": new_tags.keys() - old_tags.keys(),
+        "removed": old_tags.keys() - new_tags.keys(),
+        "changed": changed,
+        "retargeted": {tag_id for tag_id in changed if old_tags[tag_id]["target"] != new_tags[tag_id]["target"]},
+        "new_one_of": new_one_of.keys() - old_one_of.keys(),
+        "removed_one_of": old_one_of.keys() - new_one_of.keys(),
+        # the first found child is kept, so the order of the childs matters
+        "changed_one_of": {tag_id for tag_id in old_one_of.keys() & new_one_of.keys()
+                           if list(old_one_of[tag_id].items()) != list(new_one_of[tag_id].items())},
+    }
+
+
+def update_flag_tables(cursor: Cursor, old_map: Dict, new_map: Dict) -> None:
+    """Apply the flag map difference to the tags and one_of tables, unchanged rows are not touched."""
+    flag_diff = diff_flag_map(old_map, new_map)
+    for tag_id in flag_diff["removed"] | flag_diff["changed"]:
+        cursor.execute("""DELETE FROM tags WHERE tag_id = ?""", (tag_id,))
+    for tag_id in flag_diff["new"] | flag_diff["changed"]:
+        tag = new_map["tags"][tag_id]
+        cursor.execute("""INSERT INTO tags (tag_id, parent_tag_id, display, target) VALUES(?,?,?,?)""",
+                       (tag_id, tag["parent_tag"], tag["display"], tag["target"]))
+    for tag_id in flag_diff["removed_one_of"]:
+        cursor.execute("""DELETE FROM one_of WHERE tag_id = ?""", (tag_id,))
+    for tag_id in flag_diff["new_one_of"]:
+        cursor.execute("""INSERT INTO one_of (tag_id) VALUES (?)""", (tag_id,))
 
 
 def load_flag_map(database_connection: Connection) -> Callable:
     """Loads flags pair from stellaris...
-    Maybe next time, we will try to generate the flags.yaml instead of manually
-    checking the flags but it too much work.
+    The flags.yaml is written by hand, indexer.py can generate candidate flags from the game and mod files.
+    Each change of the flags.yaml is stored as a new flag map version, and each save remembers the version it was
+    scanned against. That way, only the new or changed targets are searched when the flags.yaml is edited.
     """
     with open(BASE_PATH.joinpath("flags.yaml"), "r") as file:
-        flag_map = yaml.safe_load(file)
+        flag_map = flatten_flag_map(yaml.safe_load(file))
+    # the keys are not sorted, the order of the one_of childs is part of the flag map
+    serialized_map = json.dumps(flag_map)
+    checksum = hashlib.sha256(serialized_map.encode()).hexdigest()
 
     cursor = database_connection.cursor()
-
-    recursivly_parse_flags(flag_map, cursor)
-
+    cursor.execute("SELECT version_id, checksum, flag_map FROM flag_map_versions ORDER BY version_id DESC LIMIT 1")
+    last_version = cursor.fetchone()
+    if (last_version is not None) and (last_version[1] == checksum):
+        current_version = last_version[0]
+    else:
+        old_map = json.loads(last_version[2]) if last_version is not None else {"tags": {}, "one_of": []}
+        update_flag_tables(cursor, old_map, flag_map)
+        cursor.execute("""INSERT INTO flag_map_versions (checksum, flag_map) VALUES (?,?)""",
+                       (checksum, serialized_map))
+        current_version = cursor.lastrowid
     database_connection.commit()
     cursor.close()
 
-    def build_flags(save_state_content: str, save_id: str) -> Dict:
+    one_of_childs = get_one_of_childs(flag_map)
+    # the default of a one_of group is the child without target
+    one_of_default = {tag_id: next((child for child, target in childs.items() if target is None), None)
+                      for tag_id, childs in one_of_childs.items()}
+    version_diffs = {}
+
+    def get_version_diff(cursor: Cursor, version_id: Optional[int]) -> Tuple[Dict, Dict]:
+        """
+        Get the difference between a version and the current flag map, computed once since most saves share a version.
+        :return: the flag map difference and the one_of childs of the version, saves never scanned use an empty map
         """
-        This is somewhat inefficient, need to check for performance later
-        :param save_state_content:
+        if version_id not in version_diffs:
+            version_map = {"tags": {}, "one_of": []}
+            if version_id is not None:
+                cursor.execute("SELECT flag_map FROM flag_map_versions WHERE version_id = ?", (version_id,))
+                version_map = json.loads(cursor.fetchone()[0])
+            version_diffs[version_id] = (diff_flag_map(version_map, flag_map), get_one_of_childs(version_map))
+        return version_diffs[version_id]
+
+    def build_flags(save_id: str, load_save_state: Callable[[], str]) -> None:
+        """
+        Scan a save only for the targets that changed since it was last scanned, then recompute
+        the one_of defaults of the affected groups from the stored hits.
+        :param save_id:
+        :param load_save_state: return the gamestate content, only called if some targets must be searched
         :return:
         """
         cursor = database_connection.cursor()
-        cursor.execute("SELECT * FROM one_of")
-        all_one_of_flag = cursor.fetchall()
-        all_one_flag_dict = {flag[0]: {"found": False} for flag in all_one_of_flag}
-        cursor.execute("SELECT tags.tag_id, tags.parent_tag_id, tags.target FROM tags")
-
-        for tag_id, parent_tag_id, target in cursor.fetchall():
-            if parent_tag_id in all_one_flag_dict:
-                if all_one_flag_dict[parent_tag_id]["found"] is True:
-                    continue
-                if target is None:
-                    all_one_flag_dict[parent_tag_id]["default"] = tag_id
-            if target is not None:
+        cursor.execute("SELECT flag_map_version FROM saves WHERE save_id = ?", (save_id,))
+        save_version = cursor.fetchone()[0]
+        if save_version == current_version:
+            cursor.close()
+            return
+        flag_diff, save_one_of_childs = get_version_diff(cursor, save_version)
+
+        # only the first found child of a one_of group is stored, so the childs of a changed group are searched again
+        changed_groups = flag_diff["new_one_of"] | flag_diff["changed_one_of"]
+        scanned_tags = flag_diff["new"] | flag_diff["retargeted"]
+        scanned_tags |= {tag_id for group_id in changed_groups for tag_id in one_of_childs[group_id]}
+
+        # forget the outdated hits, the former childs of the changed or removed one_of groups are searched again
+        outdated_tags = flag_diff["removed"] | scanned_tags
+        for group_id in flag_diff["changed_one_of"] | flag_diff["removed_one_of"]:
+            former_childs = set(save_one_of_childs[group_id])
+            outdated_tags |= former_childs
+            scanned_tags |= former_childs & flag_map["tags"].keys()
+        cursor.executemany("""DELETE FROM saves_tags WHERE tag_id = ? AND save_id = ?""",
+                           [(tag_id, save_id) for tag_id in outdated_tags])
+
+        targets = [(tag_id, flag_map["tags"][tag_id]["target"]) for tag_id in scanned_tags
+                   if flag_map["tags"][tag_id]["target"] is not None]
+        if len(targets) > 0:
+            save_state_content = load_save_state()
+            for tag_id, target in targets:
                 if save_state_content.find(target) > 0:
                     # found
                     cursor.execute("""INSERT INTO saves_tags (tag_id, save_id) VALUES (?,?)""", (tag_id, save_id))
-                    if parent_tag_id in all_one_flag_dict:
-                        all_one_flag_dict[parent_tag_id]["found"] = True
-        for tag_value in all_one_flag_dict:
-            if all_one_flag_dict[tag_value]["found"] is False:
-                cursor.execute("""INSERT INTO saves_tags (tag_id, save_id) VALUES (?,?)""",
-                               (all_one_flag_dict[tag_value]["default"], save_id))
+
+        for group_id in changed_groups:
+            childs = one_of_childs[group_id]
+            cursor.execute("""SELECT tag_id FROM saves_tags WHERE save_id = ? AND tag_id IN ({})""".format(
+                ", ".join(["?" for _ in childs])), (save_id, *childs))
+            found_childs = {tag_id for tag_id, in cursor.fetchall()}
+            # keep the first found child in the flags.yaml order, or the default if none was found
+            kept_child = next((tag_id for tag_id in childs if tag_id in found_childs and childs[tag_id] is not None),
+                              one_of_default[group_id])
+            cursor.executemany("""DELETE FROM saves_tags WHERE tag_id = ? AND save_id = ?""",
+                               [(tag_id, save_id) for tag_id in found_childs if tag_id != kept_child])
+            if (kept_child is not None) and (kept_child not in found_childs):
+                cursor.execute("""INSERT INTO saves_tags (tag_id, save_id) VALUES (?,?)""", (kept_child, save_id))
+        cursor.execute("""UPDATE saves SET flag_map_version = ? WHERE save_id = ?""", (current_version, save_id))
         database_connection.commit()
         cursor.close()
 
     return build_flags
 
 
+def get_index_folder() -> Path:
+    """Folder where the flags database is kept between runs, so only new saves or flags are scanned."""
+    index_folder = Path.home().joinpath(".stellaris-flag-check")
+    index_folder.mkdir(exist_ok=True)
+    return index_folder
+
+
 def init_database(database_dir):
-    """Create a new database into a temp directory for searching."""
+    """Create or open the database used for searching."""
     connection = sqlite3.connect(Path(database_dir).joinpath("flags.db"))
 
     with open(BASE_PATH.joinpath("database/init_script.sql"), 'r') as migration_script:
@@ -159,27 +290,64 @@ def init_database(database_dir):
     return connection
 
 
-def get_flag_dict(dir_to_clean):
-    """Get a dictionnary of flag_save pairs."""
-    database_connection = init_database(dir_to_clean)
+def get_save_file(nation_save: Path) -> Path:
+    """Get the save file of a nation."""
+    # assuming there may be multiple save, we only take the first one
+    return list(nation_save.glob("*.sav"))[0]
+
+
+def read_gamestate(nation_save: Path) -> str:
+    """Extract the gamestate from the save of a nation."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with zipfile.ZipFile(get_save_file(nation_save), 'r') as save_file:
+            save_file.extractall(temp_dir)
+
+        relevant_content = Path(temp_dir).joinpath(GAMESTATE)
+        with open(relevant_content, 'r') as gamestate_file:
+            return gamestate_file.read()
+
+
+def get_flag_dict(database_dir):
+    """Get a dictionnary of flag_save pairs.
+    Saves already scanned against the current flags.yaml are not read again, unless their save file changed.
+    """
+    database_connection = init_database(database_dir)
     call_function = load_flag_map(database_connection)
     try:
+        found_saves = set()
         for nation_save in tqdm(get_saves_folder()):
-            with tempfile.TemporaryDirectory() as temp_dir:
-                cursor = database_connection.cursor()
-                save_id = nation_save.stem
-                cursor.execute("""INSERT INTO saves (save_id, save_location) VALUES (?,?)""",
-                               (save_id, str(nation_save)))
-                database_connection.commit()
-                cursor.close()
-                # assuming there may be multiple save, we only take the first one
-                with zipfile.ZipFile(list(nation_save.glob("*.sav"))[0], 'r') as save_file:
-                    save_file.extractall(temp_dir)
-
-                relevant_content = Path(temp_dir).joinpath(GAMESTATE)
-                with open(relevant_content, 'r') as gamestate_file:
-                    all_content = gamestate_file.read()
-                    call_function(all_content, save_id)
+            cursor = database_connection.cursor()
+            save_id = nation_save.stem
+            save_file = get_save_file(nation_save)
+            save_file_state = (str(save_file), save_file.stat().st_mtime)
+            cursor.execute("SELECT save_file, save_mtime FROM saves WHERE save_id = ?", (save_id,))
+            scanned_file_state = cursor.fetchone()
+            if scanned_file_state is None:
+                cursor.execute("""INSERT INTO saves (save_id, save_location, save_file, save_mtime) VALUES (?,?,?,?)""",
+                               (save_id, str(nation_save), *save_file_state))
+            elif scanned_file_state != save_file_state:
+                # the game was continued or the save moved, scan it again from scratch
+                cursor.execute("""DELETE FROM saves_tags WHERE save_id = ?""", (save_id,))
+                cursor.execute("""UPDATE saves SET save_location = ?, save_file = ?, save_mtime = ?,
+                               flag_map_version = NULL WHERE save_id = ?""",
+                               (str(nation_save), *save_file_state, save_id))
+            database_connection.commit()
+            cursor.close()
+            found_saves.add(save_id)
+            call_function(save_id, partial(read_gamestate, nation_save))
+
+        # forget the deleted saves
+        cursor = database_connection.cursor()
+        cursor.execute("SELECT save_id FROM saves")
+        deleted_saves = [(save_id,) for save_id, in cursor.fetchall() if save_id not in found_saves]
+        cursor.executemany("""DELETE FROM saves_tags WHERE save_id = ?""", deleted_saves)
+        cursor.executemany("""DELETE FROM saves WHERE save_id = ?""", deleted_saves)
+        # the old flag maps are only needed by the saves not scanned against the current one
+        cursor.execute("""DELETE FROM flag_map_versions
+                       WHERE version_id != (SELECT MAX(version_id) FROM flag_map_versions)
+                       AND version_id NOT IN (SELECT flag_map_version FROM saves WHERE flag_map_version IS NOT NULL)""")
+        database_connection.commit()
+        cursor.close()
     except Exception as err:
         logging.exception(err)
         time.sleep(5)
@@ -0,0 +1,220 @@
+"""
+Headless benchmark of the user interface. Runs the MainWindow under the Qt offscreen platform against a synthetic
+database, scripts some filter sequences and reports the latency between the signal emission and the finished repaint.
+Widget count and memory growth are sampled after every filter cycle to catch widget leaks.
+
+Usage: python benchmark.py --saves 1000 --cycles 20
+"""
+import argparse
+import gc
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QCoreApplication, QEvent, QObject, Qt, Signal  # noqa: E402
+from PySide6.QtTest import QTest  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from back import init_database, load_flag_map  # noqa: E402
+from front import MainWindow  # noqa: E402
+
+
+def build_synthetic_database(database_dir: str, save_count: int, seed: int) -> sqlite3.Connection:
+    """Create a database with the tags of the flags.yaml and `save_count` fake saves.
+    Every targeted tag is found with a random probability, and exactly one tag is kept per one_of group.
+    """
+    rng = random.Random(seed)
+    connection = init_database(database_dir)
+    load_flag_map(connection)
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT tag_id FROM one_of")
+    one_of_tags = {tag_id for tag_id, in cursor.fetchall()}
+    cursor.execute("SELECT tag_id, parent_tag_id, target FROM tags WHERE display IS NOT NULL")
+    one_of_childs = defaultdict(list)
+    free_tags = []
+    for tag_id, parent_tag_id, target in cursor.fetchall():
+        if parent_tag_id in one_of_tags:
+            one_of_childs[parent_tag_id].append(tag_id)
+        elif target is not None:
+            free_tags.append(tag_id)
+
+    for index_ in range(save_count):
+        save_id = f"synthetic_{index_:06d}"
+        cursor.execute("""INSERT INTO saves (save_id, save_location) VALUES (?,?)""",
+                       (save_id, f"synthetic/save games/{save_id}"))
+        found_tags = [tag_id for tag_id in free_tags if rng.random() < 0.3]
+        found_tags.extend(rng.choice(childs) for childs in one_of_childs.values())
+        cursor.executemany("""INSERT INTO saves_tags (tag_id, save_id) VALUES (?,?)""",
+                           [(tag_id, save_id) for tag_id in found_tags])
+    connection.commit()
+    cursor.close()
+    return connection
+
+
+class SyntheticMainWindow(MainWindow):
+    """Main window reading the synthetic database instead of scanning the saves folder."""
+
+    def __init__(self, save_count: int, seed: int):
+        self.save_count = save_count
+        self.seed = seed
+        self.synthetic_dir = tempfile.TemporaryDirectory()
+        super().__init__()
+
+    def _init_database(self):
+        self.connection = build_synthetic_database(self.synthetic_dir.name, self.save_count, self.seed)
+
+    def cleanup(self):
+        super().cleanup()
+        self.synthetic_dir.cleanup()
+
+
+def current_rss_kib() -> Tuple[Optional[int], bool]:
+    """Resident memory of the process in KiB, and whether it is the peak memory instead of the current one.
+    None if the platform does not expose it.
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024, False
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, False
+    # peak memory only, it never goes down but still shows the growth
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, the other systems KiB
+    return (max_rss // 1024 if platform.system() == "Darwin" else max_rss), True
+
+
+def signal_emission_leaks() -> bool:
+    """Check for the PySide6 6.12.0 bug releasing a reference to True on every signal emission.
+    On python < 3.12, True is not immortal and the interpreter aborts after some interactions.
+    """
+    class Emitter(QObject):
+        emitted = Signal(object)
+
+    emitter = Emitter()
+    emitter.emitted.connect(lambda value: None)
+    reference_count = sys.getrefcount(True)
+    for _ in range(10):
+        emitter.emitted.emit(None)
+    return sys.getrefcount(True) < reference_count
+
+
+def flush_deleted_widgets() -> None:
+    """Process the pending deleteLater, otherwise deleted widgets are still counted."""
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QApplication.processEvents()
+
+
+class InteractionRecorder:
+    """Time the interactions from the signal emission to the end of the repaint."""
+
+    def __init__(self, window: MainWindow):
+        self.window = window
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def measure(self, name: str, action: Callable[[], None]) -> None:
+        start = time.perf_counter()
+        action()
+        QApplication.processEvents()
+        self.window.repaint()
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+
+
+def run_filter_cycle(window: MainWindow, recorder: InteractionRecorder, rng: random.Random) -> None:
+    """One realistic filter session: pick some tags, type a search, show a tag collection, then reset everything."""
+    filter_widget = window.left_filter_widget
+    leaf_tags = sorted(filter_widget.tag_buttons)
+    group_tags = sorted(filter_widget.tag_group_buttons)
+
+    for tag_id in rng.sample(leaf_tags, min(2, len(leaf_tags))):
+        recorder.measure("tag click", lambda: window.legend_widget.tag_filter.emit(tag_id))
+    if len(group_tags) > 0:
+        group_tag = rng.choice(group_tags)
+        recorder.measure("display click", lambda: window.legend_widget.tag_filter.emit(group_tag))
+
+    search_text = window.color_map[rng.choice(leaf_tags)]["display"][:4]
+    filter_edit = window.top_banner_widget.filter_edit
+    for character in search_text:
+        recorder.measure("typing", lambda: QTest.keyClicks(filter_edit, character))
+    for _ in search_text:
+        recorder.measure("typing", lambda: QTest.keyClick(filter_edit, Qt.Key_Backspace))
+
+    for button in [*filter_widget.tag_buttons.values(), *filter_widget.tag_group_buttons.values()]:
+        if button.isVisible():
+            recorder.measure("tag removal", button.click)
+
+
+def percentile_report(latencies: Dict[str, List[float]]) -> str:
+    lines = [f"{'interaction':<15}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for name, values in latencies.items():
+        if len(values) < 2:
+            cut_points = values * 99
+        else:
+            cut_points = statistics.quantiles(values, n=100, method="inclusive")
+        lines.append(f"{name:<15}{len(values):>7}{cut_points[49]:>10.2f}{cut_points[94]:>10.2f}{cut_points[98]:>10.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--saves", type=int, default=500, help="number of synthetic saves")
+    parser.add_argument("--cycles", type=int, default=20, help="number of measured filter cycles")
+    parser.add_argument("--warmup", type=int, default=2, help="number of filter cycles before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    if signal_emission_leaks():
+        parser.error("This PySide6 version leaks a reference to True on every signal emission, which crashes "
+                     "python < 3.12 after some interactions. Use another PySide6 or python version.")
+    window = SyntheticMainWindow(args.saves, args.seed)
+    window.resize(1024, 768)
+    window.show()
+    QApplication.processEvents()
+
+    rng = random.Random(args.seed)
+    for _ in range(args.warmup):
+        run_filter_cycle(window, InteractionRecorder(window), rng)
+    flush_deleted_widgets()
+
+    recorder = InteractionRecorder(window)
+    widget_counts = [len(QApplication.allWidgets())]
+    rss_samples = [current_rss_kib()[0]]
+    for _ in range(args.cycles):
+        run_filter_cycle(window, recorder, rng)
+        flush_deleted_widgets()
+        widget_counts.append(len(QApplication.allWidgets()))
+        rss_samples.append(current_rss_kib()[0])
+
+    print(f"{args.saves} saves, {args.cycles} filter cycles")
+    print(percentile_report(recorder.latencies))
+    print(f"widgets: {widget_counts[0]} -> {widget_counts[-1]} (max {max(widget_counts)})")
+    if rss_samples[0] is not None:
+        rss_kind = "peak rss" if current_rss_kib()[1] else "rss"
+        print(f"{rss_kind}: {rss_samples[0]} KiB -> {rss_samples[-1]} KiB ({rss_samples[-1] - rss_samples[0]:+d} KiB)")
+
+    window.close()
+    window.cleanup()
+    window.deleteLater()
+    flush_deleted_widgets()
+    # no python reference to the widgets must be left when the application is destroyed
+    del window, recorder
+    gc.collect()
+    app.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,19 @@ CREATE TABLE IF NOT EXISTS one_of (
     FOREIGN KEY (tag_id) REFERENCES tags(tag_id)
 );
 
+CREATE TABLE IF NOT EXISTS flag_map_versions (
+    version_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    checksum VARCHAR(64),
+    flag_map TEXT
+);
+
 CREATE TABLE IF NOT EXISTS saves (
     save_id VARCHAR(255) PRIMARY KEY,
-    save_location VARCHAR(255) UNIQUE
+    save_location VARCHAR(255) UNIQUE,
+    save_file VARCHAR(255),
+    save_mtime REAL,
+    flag_map_version INTEGER,
+    FOREIGN KEY (flag_map_version) REFERENCES flag_map_versions(version_id)
 );
 
 CREATE TABLE IF NOT EXISTS saves_tags (
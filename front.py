@@ -4,7 +4,6 @@ Visual part of the project. May have memory leak, since some sub-element are not
 import json
 import os
 import sys
-import tempfile
 import warnings
 from pathlib import Path
 from sqlite3 import Connection
@@ -17,8 +16,8 @@ from PySide6.QtWidgets import (QApplication, QGridLayout, QHBoxLayout, QLabel,
                                QTableWidgetItem, QTreeWidget, QTreeWidgetItem,
                                QVBoxLayout, QWidget)
 
-from back import (get_flag_dict, get_flags, get_tags_dict, get_tags_header,
-                  search_saves, search_saves_where_tags)
+from back import (get_flag_dict, get_flags, get_index_folder, get_tags_dict,
+                  get_tags_header, search_saves, search_saves_where_tags)
 
 
 BASE_PATH = Path(getattr(sys, "_MEIPASS", os.path.abspath(".")))
@@ -294,7 +293,6 @@ class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.temp_dir = tempfile.TemporaryDirectory()
         self._init_database()
         self._init_color_map()
         self._init_ui()
@@ -322,9 +320,9 @@ class MainWindow(QWidget):
 
     def _init_database(self):
         """Generate the database for searching.
-        Note: no cache...
+        Note: the database is kept in the index folder, only the new saves and flags are scanned.
         """
-        self.connection = get_flag_dict(self.temp_dir.name)
+        self.connection = get_flag_dict(get_index_folder())
 
     def _init_ui(self):
         """"""
@@ -386,9 +384,8 @@ class MainWindow(QWidget):
 
     @Slot()
     def cleanup(self):
-        """Clean the folder where the temporary database was created."""
+        """Close the database connection."""
         self.connection.close()
-        self.temp_dir.cleanup()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+"""
+Generate flag definitions from the Stellaris install and the workshop mods, instead of writing the flags.yaml by hand.
+The event and initializer scripts are parsed in parallel, the result of each file is cached by modification time so
+only the updated files are parsed again.
+
+Usage: python indexer.py --game <stellaris folder> --workshop <workshop folder> --output generated_flags.yaml
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+from back import (BASE_PATH, STELLARIS_APP_ID, flatten_flag_map, get_index_folder,
+                  get_steam_folder)
+
+SCRIPT_FOLDERS = ("events", "common/initializers", "common/solar_system_initializers")
+CACHE_FILE = "indexer_cache.json"
+# to increase with every change of the parse_script_file results, the previous cache is then discarded
+CACHE_VERSION = 2
+
+COMMENT_PATTERN = re.compile(r'("[^"\n]*")|#[^\n]*')
+GLOBAL_FLAG_PATTERN = re.compile(r'\bset_global_flag\s*=\s*"?([\w.@\[\]:]+)"?')
+BLOCK_PATTERN = re.compile(r"([\w.-]+)\s*=\s*\{|\{|\}")
+
+
+def get_stellaris_folders() -> Tuple[Optional[Path], Optional[Path]]:
+    """Return the default stellaris install and workshop folders from the steam library."""
+    steam_path = get_steam_folder()
+    if steam_path is None:
+        return None, None
+    return (steam_path.joinpath("steamapps/common/Stellaris"),
+            steam_path.joinpath(f"steamapps/workshop/content/{STELLARIS_APP_ID}"))
+
+
+def get_script_files(source_folders: Iterable[Path]) -> Iterable[Tuple[Path, str]]:
+    """Walk the event and initializer folders of the game and each mod, with the script folder of each file."""
+    for source_folder in source_folders:
+        for script_folder in SCRIPT_FOLDERS:
+            for script_file in sorted(source_folder.joinpath(script_folder).rglob("*.txt")):
+                yield script_file, script_folder
+
+
+def parse_script_file(script_path: str, script_folder: str) -> Dict[str, List[str]]:
+    """
+    Extract the candidate galaxy generation flags of a script file.
+    :param script_path:
+    :param script_folder: the folder from SCRIPT_FOLDERS the file was found in
+    :return: a dictionary with the global flags set in the file, and the top level keys for the initializer files
+    """
+    with open(script_path, "r", encoding="utf-8-sig", errors="ignore") as script_file:
+        # the quoted strings are kept, they may contain a '#'
+        content = COMMENT_PATTERN.sub(lambda match: match.group(1) or "", script_file.read())
+
+    # flags built from scopes or variables can not be searched in a save
+    global_flags = {flag for flag in GLOBAL_FLAG_PATTERN.findall(content) if not re.search(r"[@\[\]:]", flag)}
+
+    initializers = set()
+    if script_folder != "events":
+        depth = 0
+        for match in BLOCK_PATTERN.finditer(content):
+            if (match.group(1) is not None) and (depth == 0):
+                initializers.add(match.group(1))
+            depth += 1 if match.group(0).endswith("{") else -1
+    return {"global_flags": sorted(global_flags), "initializers": sorted(initializers)}
+
+
+def load_cache(cache_path: Path) -> Dict[str, Dict]:
+    """Load the parsing results of the previous run, an unreadable cache or one from another version is ignored."""
+    try:
+        with open(cache_path, "r") as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if (not isinstance(cache, dict)) or (cache.get("version") != CACHE_VERSION):
+        return {}
+    return cache["files"]
+
+
+def save_cache(cache_path: Path, results: Dict[str, Dict]) -> None:
+    """Write the cache in a temporary file first, an interrupted write does not leave a broken cache."""
+    temp_path = cache_path.with_name(f"{cache_path.name}.tmp")
+    with open(temp_path, "w") as cache_file:
+        json.dump({"version": CACHE_VERSION, "files": results}, cache_file)
+    os.replace(temp_path, cache_path)
+
+
+def index_script_files(script_files: Iterable[Tuple[Path, str]], cache_path: Path,
+                       max_workers: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Parse the script files in parallel, the files with the same modification time as in the cache are skipped.
+    :param script_files: the script files with their script folder
+    :param cache_path: json file of the previous results, rewritten with the current files only
+    :param max_workers: number of parsing processes, default to the number of cpu
+    :return: the parsing result of each file
+    """
+    cache = load_cache(cache_path)
+    results = {}
+    outdated_files = []
+    for script_file, script_folder in script_files:
+        file_key = str(script_file.resolve())
+        mtime = script_file.stat().st_mtime
+        if (file_key in cache) and (cache[file_key]["mtime"] == mtime):
+            results[file_key] = cache[file_key]
+        else:
+            outdated_files.append((file_key, script_folder, mtime))
+
+    if len(outdated_files) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed_files = executor.map(parse_script_file, [file_key for file_key, _, _ in outdated_files],
+                                        [script_folder for _, script_folder, _ in outdated_files], chunksize=16)
+            for (file_key, _, mtime), parsed_file in zip(outdated_files, parsed_files):
+                results[file_key] = {"mtime": mtime, **parsed_file}
+
+    save_cache(cache_path, results)
+    return results
+
+
+def load_existing_flag_map() -> Dict:
+    """Load the current flags.yaml flattened, an empty map if there is none."""
+    try:
+        with open(BASE_PATH.joinpath("flags.yaml"), "r") as file:
+            return flatten_flag_map(yaml.safe_load(file))
+    except FileNotFoundError:
+        return {"tags": {}, "one_of": []}
+
+
+def build_flag_map(results: Dict[str, Dict], existing_map: Optional[Dict] = None) -> Dict:
+    """
+    Merge the parsing results into a flags.yaml compatible map.
+    A target is kept once, since the targets and tag ids must be unique in the database. For the same reason, the
+    targets and tag ids already in the existing flattened map are left out, so the entries can be copied as is.
+    """
+    existing_map = existing_map if existing_map is not None else {"tags": {}, "one_of": []}
+    existing_ids = set(existing_map["tags"]) | {tag["target"] for tag in existing_map["tags"].values()}
+    initializers = sorted({key for result in results.values() for key in result["initializers"]} - existing_ids)
+    global_flags = sorted({flag for result in results.values() for flag in result["global_flags"]}
+                          - set(initializers) - existing_ids)
+    flag_map = {}
+    for group_id, targets in (("system_initializers", initializers), ("global_flags", global_flags)):
+        if len(targets) > 0:
+            flag_map[group_id] = {"any_of": [
+                {target: {"target": target, "display": target.replace("_", " ").title()}} for target in targets]}
+    return flag_map
+
+
+def main():
+    default_game, default_workshop = get_stellaris_folders()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--game", type=Path, default=default_game, help="stellaris install folder")
+    parser.add_argument("--workshop", type=Path, default=default_workshop,
+                        help="workshop folder, each sub folder is a mod")
+    parser.add_argument("--mod", type=Path, action="append", default=[], help="additional mod folder")
+    parser.add_argument("--output", type=Path, default=Path("generated_flags.yaml"))
+    parser.add_argument("--cache", type=Path, default=None, help="json cache of the parsed files")
+    parser.add_argument("--workers", type=int, default=None, help="number of parsing processes")
+    args = parser.parse_args()
+
+    source_folders = [args.game] if (args.game is not None) and args.game.is_dir() else []
+    if (args.workshop is not None) and args.workshop.is_dir():
+        source_folders.extend(sorted(filter(os.path.isdir, args.workshop.glob("*"))))
+    source_folders.extend(args.mod)
+    if len(source_folders) == 0:
+        parser.error("No stellaris or mod folder found, use --game, --workshop or --mod.")
+
+    cache_path = args.cache if args.cache is not None else get_index_folder().joinpath(CACHE_FILE)
+    results = index_script_files(get_script_files(source_folders), cache_path, args.workers)
+    flag_map = build_flag_map(results, load_existing_flag_map())
+    with open(args.output, "w") as output_file:
+        yaml.safe_dump(flag_map, output_file, sort_keys=False)
+    print(f"{len(results)} script files, {sum(len(group['any_of']) for group in flag_map.values())} flags "
+          f"written to {args.output}")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,195 @@
+"""
+The incremental scan after a flags.yaml change must give the same result as a full scan with the new flags.yaml.
+"""
+import copy
+import os
+import shutil
+import zipfile
+from pathlib import Path
+
+import pytest
+import yaml
+
+import back
+
+REPO_PATH = Path(__file__).parents[1]
+
+SAVES = {
+    "save_1": "t_a t_b t_c",
+    "save_2": "t_b t_new",
+    "save_3": "",
+    "save_4": "t_a t_c t_e t_new",
+}
+
+FLAG_MAP = {
+    "grp": {"one_of": [
+        {"a": {"target": "t_a", "display": "A"}},
+        {"b": {"target": "t_b", "display": "B"}},
+        {"d": {"target": None, "display": "D"}},
+    ]},
+    "other": {"any_of": [
+        {"c": {"target": "t_c", "display": "C"}},
+    ]},
+    "single": {"target": "t_e", "display": "E"},
+}
+
+
+def add_target(flag_map):
+    flag_map["other"]["any_of"].append({"n": {"target": "t_new", "display": "N"}})
+
+
+def remove_target(flag_map):
+    del flag_map["single"]
+
+
+def retarget(flag_map):
+    flag_map["other"]["any_of"][0]["c"]["target"] = "t_new"
+
+
+def retarget_one_of_child(flag_map):
+    flag_map["grp"]["one_of"][0]["a"]["target"] = "t_new"
+
+
+def reorder_one_of(flag_map):
+    childs = flag_map["grp"]["one_of"]
+    childs[0], childs[1] = childs[1], childs[0]
+
+
+def move_child_out_of_one_of(flag_map):
+    flag_map["other"]["any_of"].append(flag_map["grp"]["one_of"].pop(1))
+
+
+def move_child_into_one_of(flag_map):
+    flag_map["grp"]["one_of"].insert(0, flag_map["other"]["any_of"].pop(0))
+
+
+def one_of_to_any_of(flag_map):
+    flag_map["grp"]["any_of"] = flag_map["grp"].pop("one_of")
+
+
+def any_of_to_one_of(flag_map):
+    flag_map["other"]["one_of"] = flag_map["other"].pop("any_of")
+
+
+@pytest.fixture
+def flag_folder(tmp_path, monkeypatch):
+    """Base folder with the database script and a saves folder, the flags.yaml is written by the tests."""
+    base_path = tmp_path.joinpath("base")
+    base_path.joinpath("database").mkdir(parents=True)
+    shutil.copy(REPO_PATH.joinpath("database/init_script.sql"), base_path.joinpath("database"))
+    saves_path = tmp_path.joinpath("saves")
+    for save_id, content in SAVES.items():
+        write_save(saves_path.joinpath(save_id), content)
+    monkeypatch.setattr(back, "BASE_PATH", base_path)
+    monkeypatch.setattr(back, "get_saves_folder", lambda: sorted(saves_path.glob("*")))
+    return tmp_path
+
+
+def write_save(nation_save: Path, content: str):
+    nation_save.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(nation_save.joinpath("ironman.sav"), "w") as save_file:
+        # the targets are never at the start of a real gamestate
+        save_file.writestr(back.GAMESTATE, f"gamestate {content}")
+
+
+def scan(flag_folder: Path, flag_map, database_name: str):
+    with open(flag_folder.joinpath("base/flags.yaml"), "w") as flag_file:
+        yaml.safe_dump(flag_map, flag_file, sort_keys=False)
+    database_dir = flag_folder.joinpath(database_name)
+    database_dir.mkdir(exist_ok=True)
+    connection = back.get_flag_dict(database_dir)
+    saves_tags = sorted(connection.execute("SELECT tag_id, save_id FROM saves_tags").fetchall())
+    tags = sorted(connection.execute("SELECT * FROM tags").fetchall())
+    one_of = sorted(connection.execute("SELECT * FROM one_of").fetchall())
+    connection.close()
+    return saves_tags, tags, one_of
+
+
+@pytest.mark.parametrize("change", [add_target, remove_target, retarget, retarget_one_of_child, reorder_one_of,
+                                    move_child_out_of_one_of, move_child_into_one_of, one_of_to_any_of,
+                                    any_of_to_one_of])
+def test_incremental_scan_matches_full_scan(flag_folder, change):
+    new_flag_map = copy.deepcopy(FLAG_MAP)
+    change(new_flag_map)
+
+    scan(flag_folder, FLAG_MAP, "incremental")
+    incremental_result = scan(flag_folder, new_flag_map, "incremental")
+    full_result = scan(flag_folder, new_flag_map, "full")
+    assert incremental_result == full_result
+
+
+def test_one_of_keeps_first_found_child(flag_folder):
+    saves_tags, _, _ = scan(flag_folder, FLAG_MAP, "full")
+    assert [tag_id for tag_id, save_id in saves_tags if save_id == "save_1"] == ["a", "c"]
+    assert [tag_id for tag_id, save_id in saves_tags if save_id == "save_3"] == ["d"]
+
+
+def test_unchanged_saves_are_not_read(flag_folder, monkeypatch):
+    scan(flag_folder, FLAG_MAP, "incremental")
+    read_saves = []
+    read_gamestate = back.read_gamestate
+    monkeypatch.setattr(back, "read_gamestate", lambda nation_save: read_saves.append(nation_save.stem)
+                        or read_gamestate(nation_save))
+
+    scan(flag_folder, FLAG_MAP, "incremental")
+    assert read_saves == []
+
+    display_change = copy.deepcopy(FLAG_MAP)
+    display_change["single"]["display"] = "Renamed"
+    scan(flag_folder, display_change, "incremental")
+    assert read_saves == []
+
+
+def test_updated_save_is_scanned_again(flag_folder):
+    scan(flag_folder, FLAG_MAP, "incremental")
+    nation_save = flag_folder.joinpath("saves/save_3")
+    write_save(nation_save, "t_e")
+    save_file = nation_save.joinpath("ironman.sav")
+    os.utime(save_file, (save_file.stat().st_atime, save_file.stat().st_mtime + 10))
+
+    saves_tags, _, _ = scan(flag_folder, FLAG_MAP, "incremental")
+    assert [tag_id for tag_id, save_id in saves_tags if save_id == "save_3"] == ["d", "single"]
+
+
+def test_moved_and_deleted_saves(flag_folder, monkeypatch):
+    scan(flag_folder, FLAG_MAP, "incremental")
+    saves_path = flag_folder.joinpath("saves")
+    shutil.rmtree(saves_path.joinpath("save_2"))
+    saves_path.joinpath("moved").mkdir()
+    shutil.move(saves_path.joinpath("save_4"), saves_path.joinpath("moved/save_4"))
+    monkeypatch.setattr(back, "get_saves_folder",
+                        lambda: [*sorted(saves_path.glob("save_*")), saves_path.joinpath("moved/save_4")])
+
+    scan(flag_folder, FLAG_MAP, "incremental")
+    connection = back.init_database(flag_folder.joinpath("incremental"))
+    saves = dict(connection.execute("SELECT save_id, save_location FROM saves").fetchall())
+    assert sorted(saves) == ["save_1", "save_3", "save_4"]
+    assert saves["save_4"] == str(saves_path.joinpath("moved/save_4"))
+    assert connection.execute("SELECT COUNT(*) FROM saves_tags WHERE save_id = 'save_2'").fetchone() == (0,)
+    connection.close()
+
+
+def test_unused_flag_map_versions_are_pruned(flag_folder):
+    new_flag_map = copy.deepcopy(FLAG_MAP)
+    for change in (None, add_target, remove_target):
+        if change is not None:
+            change(new_flag_map)
+        scan(flag_folder, new_flag_map, "incremental")
+    connection = back.init_database(flag_folder.joinpath("incremental"))
+    assert connection.execute("SELECT COUNT(*) FROM flag_map_versions").fetchone() == (1,)
+    assert connection.execute("SELECT DISTINCT flag_map_version FROM saves").fetchall() == connection.execute(
+        "SELECT version_id FROM flag_map_versions").fetchall()
+    connection.close()
+
+
+def test_flag_map_diff_is_computed_once_per_version(flag_folder, monkeypatch):
+    scan(flag_folder, FLAG_MAP, "incremental")
+    diff_calls = []
+    diff_flag_map = back.diff_flag_map
+    monkeypatch.setattr(back, "diff_flag_map", lambda *maps: diff_calls.append(maps) or diff_flag_map(*maps))
+
+    new_flag_map = copy.deepcopy(FLAG_MAP)
+    add_target(new_flag_map)
+    scan(flag_folder, new_flag_map, "incremental")
+    # once to update the tags table, once for all the saves scanned against the previous version
+    assert len(diff_calls) == 2
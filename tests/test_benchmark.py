@@ -0,0 +1,65 @@
+"""
+Smoke test of the benchmark harness, so a change of the front widgets does not silently break it.
+"""
+import random
+from pathlib import Path
+
+import pytest
+
+benchmark = pytest.importorskip("benchmark")
+
+import back  # noqa: E402
+import front  # noqa: E402
+
+REPO_PATH = Path(__file__).parents[1]
+
+
+@pytest.fixture(scope="module")
+def app():
+    return benchmark.QApplication.instance() or benchmark.QApplication([])
+
+
+@pytest.fixture
+def window(app, monkeypatch):
+    if benchmark.signal_emission_leaks():
+        pytest.skip("this PySide6 version crashes python after some signal emissions")
+    monkeypatch.setattr(back, "BASE_PATH", REPO_PATH)
+    monkeypatch.setattr(front, "BASE_PATH", REPO_PATH)
+    window = benchmark.SyntheticMainWindow(5, 0)
+    window.show()
+    yield window
+    window.close()
+    window.cleanup()
+    window.deleteLater()
+    benchmark.flush_deleted_widgets()
+
+
+def test_percentile_report():
+    report = benchmark.percentile_report({"typing": [float(value) for value in range(1, 101)], "tag click": [3.0]})
+    lines = report.splitlines()
+    assert lines[0].split() == ["interaction", "count", "p50", "ms", "p95", "ms", "p99", "ms"]
+    assert lines[1].split() == ["typing", "100", "50.50", "95.05", "99.01"]
+    assert lines[2].split() == ["tag", "click", "1", "3.00", "3.00", "3.00"]
+
+
+def test_synthetic_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(back, "BASE_PATH", REPO_PATH)
+    connection = benchmark.build_synthetic_database(str(tmp_path), 5, 0)
+    assert connection.execute("SELECT COUNT(*) FROM saves").fetchone() == (5,)
+    one_of_count = connection.execute("SELECT COUNT(*) FROM one_of").fetchone()[0]
+    # exactly one child of each one_of group per save
+    assert connection.execute("""SELECT COUNT(*) FROM saves_tags JOIN tags ON saves_tags.tag_id = tags.tag_id
+                              WHERE tags.parent_tag_id IN (SELECT tag_id FROM one_of)""").fetchone() == (
+        5 * one_of_count,)
+    connection.close()
+
+
+def test_run_filter_cycle(window):
+    recorder = benchmark.InteractionRecorder(window)
+    benchmark.run_filter_cycle(window, recorder, random.Random(0))
+    assert {"tag click", "display click", "typing", "tag removal"} <= set(recorder.latencies)
+    assert all(latency >= 0 for latencies in recorder.latencies.values() for latency in latencies)
+    # every filter is removed at the end of the cycle
+    assert window.left_filter_widget.selected_tag == set()
+    assert window.left_filter_widget.displayed_tag == set()
+    assert window.top_banner_widget.filter_edit.text() == ""
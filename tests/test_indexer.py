@@ -0,0 +1,125 @@
+"""
+The sample scripts stand in for the game install and a workshop mod.
+"""
+import os
+import shutil
+from concurrent.futures import Executor
+from pathlib import Path
+
+import pytest
+import yaml
+
+import back
+import indexer
+
+REPO_PATH = Path(__file__).parents[1]
+SAMPLES_PATH = Path(__file__).parent.joinpath("samples")
+
+
+class InlineExecutor(Executor):
+    """Parse in the test process and record the parsed files."""
+
+    parsed_files = []
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def map(self, fn, *iterables, chunksize=1):
+        script_paths, script_folders = iterables
+        InlineExecutor.parsed_files.extend(Path(script_path).name for script_path in script_paths)
+        return list(map(fn, script_paths, script_folders))
+
+
+@pytest.fixture
+def source_folders(tmp_path):
+    shutil.copytree(SAMPLES_PATH, tmp_path.joinpath("samples"))
+    return [tmp_path.joinpath("samples/game"), tmp_path.joinpath("samples/workshop/initializers_pack")]
+
+
+@pytest.fixture
+def inline_executor(monkeypatch):
+    InlineExecutor.parsed_files = []
+    monkeypatch.setattr(indexer, "ProcessPoolExecutor", InlineExecutor)
+    return InlineExecutor
+
+
+def test_parse_event_file():
+    result = indexer.parse_script_file(str(SAMPLES_PATH.joinpath("game/events/horizon_events.txt")), "events")
+    assert result == {"global_flags": ["horizonsignal_spawn", "quoted_flag"], "initializers": []}
+
+
+def test_parse_initializer_file():
+    result = indexer.parse_script_file(
+        str(SAMPLES_PATH.joinpath("game/common/solar_system_initializers/guardian_initializers.txt")),
+        "common/solar_system_initializers")
+    assert result == {"global_flags": ["dragon_placed"],
+                      "initializers": ["guardians_dragon_system", "scavenger_bot_system"]}
+
+
+def test_build_flag_map(source_folders, tmp_path):
+    results = indexer.index_script_files(indexer.get_script_files(source_folders), tmp_path.joinpath("cache.json"))
+    flag_map = indexer.build_flag_map(results)
+    assert [next(iter(tag)) for tag in flag_map["system_initializers"]["any_of"]] == [
+        "guardians_dragon_system", "scavenger_bot_system"]
+    # the mod folder name contains 'initializers', but its event keys are not initializers
+    assert [next(iter(tag)) for tag in flag_map["global_flags"]["any_of"]] == [
+        "dragon_placed", "horizonsignal_spawn", "mod_flag", "quoted_flag"]
+    assert flag_map["global_flags"]["any_of"][0]["dragon_placed"] == {"target": "dragon_placed",
+                                                                     "display": "Dragon Placed"}
+
+
+def test_only_updated_files_are_parsed_again(source_folders, tmp_path, inline_executor):
+    cache_path = tmp_path.joinpath("cache.json")
+    first_results = indexer.index_script_files(indexer.get_script_files(source_folders), cache_path)
+    assert len(inline_executor.parsed_files) == 3
+
+    inline_executor.parsed_files = []
+    mod_file = source_folders[1].joinpath("events/mod_events.txt")
+    os.utime(mod_file, (mod_file.stat().st_atime, mod_file.stat().st_mtime + 10))
+    results = indexer.index_script_files(indexer.get_script_files(source_folders), cache_path)
+    assert inline_executor.parsed_files == ["mod_events.txt"]
+    assert indexer.build_flag_map(results) == indexer.build_flag_map(first_results)
+
+
+def test_cache_key_does_not_depend_on_working_directory(source_folders, tmp_path, inline_executor, monkeypatch):
+    cache_path = tmp_path.joinpath("cache.json")
+    indexer.index_script_files(indexer.get_script_files(source_folders), cache_path)
+
+    inline_executor.parsed_files = []
+    monkeypatch.chdir(tmp_path)
+    relative_folders = [source_folder.relative_to(tmp_path) for source_folder in source_folders]
+    indexer.index_script_files(indexer.get_script_files(relative_folders), cache_path)
+    assert inline_executor.parsed_files == []
+
+
+@pytest.mark.parametrize("cache_content", ["{bad", '{"mtime": 1}', '{"version": 1, "files": {}}', "[]"])
+def test_unreadable_or_outdated_cache_is_ignored(source_folders, tmp_path, inline_executor, cache_content):
+    cache_path = tmp_path.joinpath("cache.json")
+    cache_path.write_text(cache_content)
+    results = indexer.index_script_files(indexer.get_script_files(source_folders), cache_path)
+    assert len(inline_executor.parsed_files) == 3
+    assert indexer.load_cache(cache_path) == results
+    assert not cache_path.with_name("cache.json.tmp").exists()
+
+
+def test_existing_flags_are_left_out(source_folders, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexer, "BASE_PATH", REPO_PATH)
+    results = indexer.index_script_files(indexer.get_script_files(source_folders), tmp_path.joinpath("cache.json"))
+    flag_map = indexer.build_flag_map(results, indexer.load_existing_flag_map())
+    generated_ids = [next(iter(tag)) for group in flag_map.values() for tag in group["any_of"]]
+    # already targets of ether_dragon, scavenger and horizon in the flags.yaml
+    assert generated_ids == ["dragon_placed", "mod_flag", "quoted_flag"]
+
+    # the generated entries can be added to the flags.yaml as is
+    tmp_path.joinpath("database").mkdir()
+    shutil.copy(REPO_PATH.joinpath("database/init_script.sql"), tmp_path.joinpath("database"))
+    with open(REPO_PATH.joinpath("flags.yaml"), "r") as flag_file:
+        merged_map = {**yaml.safe_load(flag_file), **flag_map}
+    with open(tmp_path.joinpath("flags.yaml"), "w") as flag_file:
+        yaml.safe_dump(merged_map, flag_file, sort_keys=False)
+    monkeypatch.setattr(back, "BASE_PATH", tmp_path)
+    connection = back.init_database(tmp_path)
+    back.load_flag_map(connection)
+    assert connection.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == len(
+        back.flatten_flag_map(merged_map)["tags"])
+    connection.close()